@@ -16,8 +16,8 @@ limitations under the License.
 #include "tensorflow/core/kernels/cwise_ops_common.h"
 
 namespace tensorflow {
-REGISTER4(BinaryOp, CPU, "Maximum", functor::maximum, float, double, int32,
-          int64);
+REGISTER6(BinaryOp, CPU, "Maximum", functor::maximum, float, double, int8,
+          int16, int32, int64);
 #if GOOGLE_CUDA
 REGISTER3(BinaryOp, GPU, "Maximum", functor::maximum, float, double, int64);
 #endif
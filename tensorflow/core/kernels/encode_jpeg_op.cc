@@ -54,8 +54,6 @@ class EncodeJpegOp : public OpKernel {
         context, context->GetAttr("optimize_size", &flags_.optimize_jpeg_size));
     OP_REQUIRES_OK(context, context->GetAttr("chroma_downsampling",
                                              &flags_.chroma_downsampling));
-    OP_REQUIRES_OK(context, context->GetAttr("chroma_downsampling",
-                                             &flags_.chroma_downsampling));
 
     string density_unit;
     OP_REQUIRES_OK(context, context->GetAttr("density_unit", &density_unit));
@@ -20,10 +20,16 @@ limitations under the License.
 #define TENSORFLOW_LIB_JPEG_JPEG_HANDLE_H_
 
 extern "C" {
+#ifdef TF_USE_LIBJPEG_TURBO
+#include "third_party/jpeg_turbo/src/jerror.h"
+#include "third_party/jpeg_turbo/src/jinclude.h"
+#include "third_party/jpeg_turbo/src/jpeglib.h"
+#else
 #include "external/jpeg_archive/jpeg-9a/jerror.h"
 #include "external/jpeg_archive/jpeg-9a/jinclude.h"
 #include "external/jpeg_archive/jpeg-9a/jpeglib.h"
 #include "external/jpeg_archive/jpeg-9a/transupp.h"  // for rotations
+#endif
 }
 
 #include "tensorflow/core/platform/port.h"
@@ -359,6 +359,11 @@ bool WriteImageToBuffer(
   // There used to be a call to png_set_filter here turning off filtering
   // entirely, but it produced pessimal compression ratios.  I'm not sure
   // why it was there.
+  // At level 0 zlib only stores the rows, so no filter can make the output
+  // smaller; skip libpng's per-row trial of all five filters.
+  if (compression == 0) {
+    png_set_filter(png_ptr, PNG_FILTER_TYPE_BASE, PNG_FILTER_NONE);
+  }
   png_set_IHDR(png_ptr, info_ptr, width, height, channel_bits, color_type,
                PNG_INTERLACE_NONE, PNG_COMPRESSION_TYPE_DEFAULT,
                PNG_FILTER_TYPE_DEFAULT);
@@ -305,7 +305,7 @@ REGISTER_OP("Maximum")
     .Input("x: T")
     .Input("y: T")
     .Output("z: T")
-    .Attr("T: {float, double, int32, int64}")
+    .Attr("T: {float, double, int8, int16, int32, int64}")
     .SetIsCommutative()
     .Doc(R"doc(
 Returns the max of x and y (i.e. x > y ? x : y) element-wise, broadcasts.
@@ -315,7 +315,7 @@ REGISTER_OP("Minimum")
     .Input("x: T")
     .Input("y: T")
     .Output("z: T")
-    .Attr("T: {float, double, int32, int64}")
+    .Attr("T: {float, double, int8, int16, int32, int64}")
     .SetIsCommutative()
     .Doc(R"doc(
 Returns the min of x and y (i.e. x < y ? x : y) element-wise, broadcasts.
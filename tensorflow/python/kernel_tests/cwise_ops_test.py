@@ -921,14 +921,14 @@ class MinMaxOpTest(tf.test.TestCase):
   def testBasic(self):
     x = np.random.rand(1, 3, 2) * 100.
     y = np.random.rand(1, 3, 2) * 100.
-    for t in [np.float32, np.float64, np.int32, np.int64]:
+    for t in [np.float32, np.float64, np.int8, np.int16, np.int32, np.int64]:
       self._compare(x.astype(t), y.astype(t), use_gpu=False)
       self._compare(x.astype(t), y.astype(t), use_gpu=True)
 
   def testDifferentShapes(self):
     x = np.random.rand(1, 3, 2) * 100.
     y = np.random.rand(2) * 100.  # should broadcast
-    for t in [np.float32, np.float64, np.int32, np.int64]:
+    for t in [np.float32, np.float64, np.int8, np.int16, np.int32, np.int64]:
       self._compare(x.astype(t), y.astype(t), use_gpu=False)
       self._compare(x.astype(t), y.astype(t), use_gpu=True)
 
@@ -18,23 +18,143 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import contextlib
 import math
+import struct
+import zlib
 
 import tensorflow.python.platform
 
 import numpy as np
-from six.moves import xrange  # pylint: disable=redefined-builtin
 
+from tensorflow.core.framework import config_pb2
+from tensorflow.python.client import graph_util
+from tensorflow.python.client import session
+from tensorflow.python.framework import ops
 from tensorflow.python.framework import test_util
 from tensorflow.python.framework import dtypes
 from tensorflow.python.ops import array_ops
 from tensorflow.python.ops import constant_op
 from tensorflow.python.ops import image_ops
 from tensorflow.python.ops import io_ops
+from tensorflow.python.ops import math_ops
+from tensorflow.python.ops import random_ops
 from tensorflow.python.platform import googletest
 
-
-class RGBToHSVTest(test_util.TensorFlowTestCase):
+# Luma weights used by image_ops.rgb_to_grayscale.
+_GRAYSCALE_WEIGHTS = np.array([0.2989, 0.5870, 0.1140], dtype=np.float32)
+_GRAYSCALE_WEIGHTS.flags.writeable = False
+
+# Twelve channel values (four RGB pixels) shared by the color adjustment tests.
+_DATA_12 = np.array([0, 5, 13, 54, 135, 226, 37, 8, 234, 90, 255, 1],
+                    dtype=np.uint8)
+_DATA_12_F32_NORM = _DATA_12.astype(np.float32) / 255.
+# Shared by many tests, so guard them against in-place modification.
+_DATA_12.flags.writeable = False
+_DATA_12_F32_NORM.flags.writeable = False
+
+
+def _SessionConfig():
+  """Returns the session config used by the tests in this file."""
+  config = config_pb2.ConfigProto()
+  config.allow_soft_placement = True
+  config.gpu_options.per_process_gpu_memory_fraction = 0.3
+  # The test target is sharded, so several of these sessions run at once.
+  config.inter_op_parallelism_threads = 1
+  config.intra_op_parallelism_threads = 2
+  return config
+
+
+class _CappedThreadsTestCase(test_util.TensorFlowTestCase):
+  """Makes `test_session` default to `_SessionConfig()`."""
+
+  def test_session(self, graph=None, config=None, use_gpu=False,
+                   force_gpu=False):
+    if config is None:
+      config = _SessionConfig()
+      config.allow_soft_placement = not force_gpu
+    return super(_CappedThreadsTestCase, self).test_session(
+        graph=graph, config=config, use_gpu=use_gpu, force_gpu=force_gpu)
+
+
+class _CachedSessionTestCase(_CappedThreadsTestCase):
+  """Shares one session between all the tests of a test case.
+
+  The tests using this only run a handful of ops on tiny tensors, so creating
+  a fresh session per test dominates their run time.
+  """
+
+  @classmethod
+  def setUpClass(cls):
+    cls._class_session = session.Session(graph=ops.Graph(),
+                                         config=_SessionConfig())
+
+  @classmethod
+  def tearDownClass(cls):
+    cls._class_session.close()
+    cls._class_session = None
+
+  # pylint: disable=g-doc-return-or-yield
+  @contextlib.contextmanager
+  def _cachedSession(self, use_gpu=False):
+    """Like `test_session`, but returns the session shared by the class."""
+    sess = self._class_session
+    with sess.graph.as_default(), sess.as_default():
+      if use_gpu:
+        yield sess
+      else:
+        with sess.graph.device(graph_util.pin_to_cpu):
+          yield sess
+  # pylint: enable=g-doc-return-or-yield
+
+  def _assertEqualGraph(self, sess, ys, expected_np):
+    """Asserts that integer tensors equal `expected_np`, comparing in the graph.
+
+    Only the shapes and one boolean per tensor are fetched.  Prefer
+    `assertAllEqual` on the evaluated tensors when a failure needs to report
+    the mismatching values.
+
+    Args:
+      sess: The session to run the comparison in.
+      ys: A `Tensor` or a list of `Tensor`s with an integer type.
+      expected_np: A numpy array with the expected value of each of `ys`.
+    """
+    if not isinstance(ys, (list, tuple)):
+      ys = [ys]
+    # There is no uint8 kernel for Equal, so compare as int32.
+    expected = constant_op.constant(expected_np.astype(np.int32))
+    shapes = [array_ops.shape(y) for y in ys]
+    equals = [math_ops.reduce_all(
+        math_ops.equal(math_ops.cast(y, dtypes.int32), expected)) for y in ys]
+    results = sess.run(shapes + equals)
+    for shape in results[:len(ys)]:
+      self.assertAllEqual(shape, expected_np.shape)
+    for equal in results[len(ys):]:
+      self.assertTrue(equal)
+
+
+class RGBToHSVTest(_CappedThreadsTestCase):
+
+  def _NumpyRGBToHSV(self, rgb):
+    # Mirrors the select-based formulation of the RGBToHSV kernel, so no
+    # per-pixel branching is needed.
+    red, green, blue = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    value = rgb.max(axis=-1)
+    chroma = value - rgb.min(axis=-1)
+    nonzero = chroma > 0
+    norm = np.divide(1. / 6., chroma, out=np.zeros_like(chroma),
+                     where=nonzero)
+    hue = np.where(red == value, norm * (green - blue),
+                   np.where(green == value, norm * (blue - red) + 2. / 6.,
+                            norm * (red - green) + 4. / 6.))
+    hue = np.where(nonzero, hue, 0.)
+    hue = np.where(hue < 0., hue + 1., hue)
+    hsv = np.empty_like(rgb)
+    hsv[..., 0] = hue
+    hsv[..., 1] = np.divide(chroma, value, out=np.zeros_like(chroma),
+                            where=value > 0)
+    hsv[..., 2] = value
+    return hsv
 
   def testBatch(self):
     # Build an arbitrary RGB image
@@ -49,57 +169,55 @@ class RGBToHSVTest(test_util.TensorFlowTestCase):
       batch1 = image_ops.rgb_to_hsv(batch0)
       batch2 = image_ops.hsv_to_rgb(batch1)
       split0 = array_ops.unpack(batch0)
-      split1 = list(map(image_ops.rgb_to_hsv, split0))
-      split2 = list(map(image_ops.hsv_to_rgb, split1))
-      join1 = array_ops.pack(split1)
-      join2 = array_ops.pack(split2)
-      batch1, batch2, join1, join2 = sess.run([batch1, batch2, join1, join2])
+      split1 = [image_ops.rgb_to_hsv(image) for image in split0]
+      split2 = [image_ops.hsv_to_rgb(image) for image in split1]
+      results = sess.run([batch1, batch2] + split1 + split2)
+    batch1, batch2 = results[:2]
+    join1 = np.array(results[2:2 + batch_size])
+    join2 = np.array(results[2 + batch_size:])
 
     # Verify that processing batch elements together is the same as separate
     self.assertAllClose(batch1, join1)
     self.assertAllClose(batch2, join2)
     self.assertAllClose(batch2, inp)
+    self.assertAllClose(batch1, self._NumpyRGBToHSV(inp))
 
   def testRGBToHSVRoundTrip(self):
-    data = [0, 5, 13, 54, 135, 226, 37, 8, 234, 90, 255, 1]
-    rgb_np = np.array(data, dtype=np.float32).reshape([2, 2, 3]) / 255.
+    rgb_np = _DATA_12_F32_NORM.reshape([2, 2, 3])
+    hsv_np = self._NumpyRGBToHSV(rgb_np)
     for use_gpu in [True, False]:
-      with self.test_session(use_gpu=use_gpu):
+      with self.test_session(use_gpu=use_gpu) as sess:
         hsv = image_ops.rgb_to_hsv(rgb_np)
         rgb = image_ops.hsv_to_rgb(hsv)
-        rgb_tf = rgb.eval()
-    self.assertAllClose(rgb_tf, rgb_np)
-
-
-class GrayscaleToRGBTest(test_util.TensorFlowTestCase):
-
-  def _RGBToGrayscale(self, images):
-    is_batch = True
-    if len(images.shape) == 3:
-      is_batch = False
-      images = np.expand_dims(images, axis=0)
-    out_shape = images.shape[0:3] + (1,)
-    out = np.zeros(shape=out_shape, dtype=np.uint8)
-    for batch in xrange(images.shape[0]):
-      for y in xrange(images.shape[1]):
-        for x in xrange(images.shape[2]):
-          red = images[batch, y, x, 0]
-          green = images[batch, y, x, 1]
-          blue = images[batch, y, x, 2]
-          gray = 0.2989 * red + 0.5870 * green + 0.1140 * blue
-          out[batch, y, x, 0] = int(gray)
-    if not is_batch:
-      out = np.squeeze(out, axis=0)
+        hsv_tf, rgb_tf = sess.run([hsv, rgb])
+        self.assertAllClose(hsv_tf, hsv_np)
+        self.assertAllClose(rgb_tf, rgb_np)
+
+
+class GrayscaleToRGBTest(_CachedSessionTestCase):
+
+  def _RGBToGrayscale(self, images, out=None):
+    # Contract the channel axis against the luma weights in one pass; this
+    # handles both 3-D and batched 4-D inputs without reshaping.  If given,
+    # `out` must be a uint8 array of shape `images.shape[:-1] + (1,)`.
+    # Follow rgb_to_grayscale: convert_image_dtype scales to [0, 1] by 1/255,
+    # and converts back by multiplying with 255.5 and truncating, so white
+    # stays 255 and [1, 2, 3] maps to 1.
+    flt = images.astype(np.float32) * np.float32(1. / 255)
+    gray = np.tensordot(flt, _GRAYSCALE_WEIGHTS, axes=([-1], [0]))
+    gray *= np.float32(255.5)
+    if out is None:
+      return gray.astype(np.uint8)[..., np.newaxis]
+    np.copyto(out[..., 0], gray, casting='unsafe')
     return out
 
   def _TestRGBToGrayscale(self, x_np):
     y_np = self._RGBToGrayscale(x_np)
 
-    with self.test_session():
+    with self._cachedSession() as sess:
       x_tf = constant_op.constant(x_np, shape=x_np.shape)
       y = image_ops.rgb_to_grayscale(x_tf)
-      y_tf = y.eval()
-      self.assertAllEqual(y_tf, y_np)
+      self._assertEqualGraph(sess, y, y_np)
 
   def testBasicRGBToGrayscale(self):
     # 4-D input with batch dimension.
@@ -111,35 +229,43 @@ class GrayscaleToRGBTest(test_util.TensorFlowTestCase):
     x_np = np.array([[1, 2, 3], [4, 10, 1]], dtype=np.uint8).reshape([1, 2, 3])
     self._TestRGBToGrayscale(x_np)
 
+    # Bright pixels, where truncating without the op's +0.5 would be off.
+    x_np = np.array([[255, 255, 255], [0, 0, 0]],
+                    dtype=np.uint8).reshape([1, 2, 3])
+    self.assertAllEqual(self._RGBToGrayscale(x_np).ravel(), [255, 0])
+    self._TestRGBToGrayscale(x_np)
+
+    # The reference must give the same result into a preallocated buffer.
+    out = np.empty(x_np.shape[:-1] + (1,), np.uint8)
+    self.assertIs(self._RGBToGrayscale(x_np, out=out), out)
+    self.assertAllEqual(out, self._RGBToGrayscale(x_np))
+
   def testBasicGrayscaleToRGB(self):
     # 4-D input with batch dimension.
     x_np = np.array([[1, 2]], dtype=np.uint8).reshape([1, 1, 2, 1])
     y_np = np.array([[1, 1, 1], [2, 2, 2]],
                     dtype=np.uint8).reshape([1, 1, 2, 3])
 
-    with self.test_session():
+    with self._cachedSession() as sess:
       x_tf = constant_op.constant(x_np, shape=x_np.shape)
       y = image_ops.grayscale_to_rgb(x_tf)
-      y_tf = y.eval()
-      self.assertAllEqual(y_tf, y_np)
+      self._assertEqualGraph(sess, y, y_np)
 
     # 3-D input with no batch dimension.
     x_np = np.array([[1, 2]], dtype=np.uint8).reshape([1, 2, 1])
     y_np = np.array([[1, 1, 1], [2, 2, 2]], dtype=np.uint8).reshape([1, 2, 3])
 
-    with self.test_session():
+    with self._cachedSession() as sess:
       x_tf = constant_op.constant(x_np, shape=x_np.shape)
       y = image_ops.grayscale_to_rgb(x_tf)
-      y_tf = y.eval()
-      self.assertAllEqual(y_tf, y_np)
+      self._assertEqualGraph(sess, y, y_np)
 
 
-class AdjustHueTest(test_util.TensorFlowTestCase):
+class AdjustHueTest(_CappedThreadsTestCase):
 
   def testAdjustNegativeHue(self):
     x_shape = [2, 2, 3]
-    x_data = [0, 5, 13, 54, 135, 226, 37, 8, 234, 90, 255, 1]
-    x_np = np.array(x_data, dtype=np.uint8).reshape(x_shape)
+    x_np = _DATA_12.reshape(x_shape)
 
     delta = -0.25
     y_data = [0, 13, 1, 54, 226, 59, 8, 234, 150, 255, 39, 1]
@@ -153,8 +279,7 @@ class AdjustHueTest(test_util.TensorFlowTestCase):
 
   def testAdjustPositiveHue(self):
     x_shape = [2, 2, 3]
-    x_data = [0, 5, 13, 54, 135, 226, 37, 8, 234, 90, 255, 1]
-    x_np = np.array(x_data, dtype=np.uint8).reshape(x_shape)
+    x_np = _DATA_12.reshape(x_shape)
 
     delta = 0.25
     y_data = [13, 0, 11, 226, 54, 221, 234, 8, 92, 1, 217, 255]
@@ -167,12 +292,11 @@ class AdjustHueTest(test_util.TensorFlowTestCase):
       self.assertAllEqual(y_tf, y_np)
 
 
-class AdjustSaturationTest(test_util.TensorFlowTestCase):
+class AdjustSaturationTest(_CappedThreadsTestCase):
 
   def testHalfSaturation(self):
     x_shape = [2, 2, 3]
-    x_data = [0, 5, 13, 54, 135, 226, 37, 8, 234, 90, 255, 1]
-    x_np = np.array(x_data, dtype=np.uint8).reshape(x_shape)
+    x_np = _DATA_12.reshape(x_shape)
 
     saturation_factor = 0.5
     y_data = [6, 9, 13, 140, 180, 226, 135, 121, 234, 172, 255, 128]
@@ -186,8 +310,7 @@ class AdjustSaturationTest(test_util.TensorFlowTestCase):
 
   def testTwiceSaturation(self):
     x_shape = [2, 2, 3]
-    x_data = [0, 5, 13, 54, 135, 226, 37, 8, 234, 90, 255, 1]
-    x_np = np.array(x_data, dtype=np.uint8).reshape(x_shape)
+    x_np = _DATA_12.reshape(x_shape)
 
     saturation_factor = 2.0
     y_data = [0, 5, 13, 0, 106, 226, 30, 0, 234, 89, 255, 0]
@@ -200,111 +323,120 @@ class AdjustSaturationTest(test_util.TensorFlowTestCase):
       self.assertAllEqual(y_tf, y_np)
 
 
-class FlipTest(test_util.TensorFlowTestCase):
+class FlipTest(_CachedSessionTestCase):
+
+  def _onDevices(self, image_fn, x_np):
+    """Returns `image_fn(x_np)` built once on the CPU and once on the GPU."""
+    x_tf = constant_op.constant(x_np, shape=x_np.shape)
+    ys = []
+    for device in '/cpu:0', '/gpu:0':
+      with ops.device(device):
+        ys.append(image_fn(x_tf))
+    return ys
+
+  def _maxAbsDiff(self, image_fn):
+    """Returns a function computing max(|image_fn(x) - x|) in the graph."""
+    def max_abs_diff(x):
+      # Run image_fn on the uint8 input; only the difference needs int32.
+      y = math_ops.cast(image_fn(x), dtypes.int32)
+      x = math_ops.cast(x, dtypes.int32)
+      return math_ops.reduce_max(math_ops.abs(y - x))
+    return max_abs_diff
 
   def testIdempotentLeftRight(self):
     x_np = np.array([[1, 2, 3], [1, 2, 3]], dtype=np.uint8).reshape([2, 3, 1])
-    for use_gpu in [False, True]:
-      with self.test_session(use_gpu=use_gpu):
-        x_tf = constant_op.constant(x_np, shape=x_np.shape)
-        y = image_ops.flip_left_right(image_ops.flip_left_right(x_tf))
-        y_tf = y.eval()
-        self.assertAllEqual(y_tf, x_np)
+    flip = lambda x: image_ops.flip_left_right(image_ops.flip_left_right(x))
+    with self._cachedSession(use_gpu=True) as sess:
+      diffs = sess.run(self._onDevices(self._maxAbsDiff(flip), x_np))
+    self.assertAllEqual(diffs, [0, 0])
 
   def testLeftRight(self):
     x_np = np.array([[1, 2, 3], [1, 2, 3]], dtype=np.uint8).reshape([2, 3, 1])
     y_np = np.array([[3, 2, 1], [3, 2, 1]], dtype=np.uint8).reshape([2, 3, 1])
 
-    for use_gpu in [False, True]:
-      with self.test_session(use_gpu=use_gpu):
-        x_tf = constant_op.constant(x_np, shape=x_np.shape)
-        y = image_ops.flip_left_right(x_tf)
-        y_tf = y.eval()
-        self.assertAllEqual(y_tf, y_np)
+    with self._cachedSession(use_gpu=True) as sess:
+      ys = self._onDevices(image_ops.flip_left_right, x_np)
+      self._assertEqualGraph(sess, ys, y_np)
 
   def testIdempotentUpDown(self):
     x_np = np.array([[1, 2, 3], [4, 5, 6]], dtype=np.uint8).reshape([2, 3, 1])
 
-    for use_gpu in [False, True]:
-      with self.test_session(use_gpu=use_gpu):
-        x_tf = constant_op.constant(x_np, shape=x_np.shape)
-        y = image_ops.flip_up_down(image_ops.flip_up_down(x_tf))
-        y_tf = y.eval()
-        self.assertAllEqual(y_tf, x_np)
+    flip = lambda x: image_ops.flip_up_down(image_ops.flip_up_down(x))
+    with self._cachedSession(use_gpu=True) as sess:
+      diffs = sess.run(self._onDevices(self._maxAbsDiff(flip), x_np))
+    self.assertAllEqual(diffs, [0, 0])
 
   def testUpDown(self):
     x_np = np.array([[1, 2, 3], [4, 5, 6]], dtype=np.uint8).reshape([2, 3, 1])
     y_np = np.array([[4, 5, 6], [1, 2, 3]], dtype=np.uint8).reshape([2, 3, 1])
 
-    for use_gpu in [False, True]:
-      with self.test_session(use_gpu=use_gpu):
-        x_tf = constant_op.constant(x_np, shape=x_np.shape)
-        y = image_ops.flip_up_down(x_tf)
-        y_tf = y.eval()
-        self.assertAllEqual(y_tf, y_np)
+    with self._cachedSession(use_gpu=True) as sess:
+      ys = self._onDevices(image_ops.flip_up_down, x_np)
+      self._assertEqualGraph(sess, ys, y_np)
 
   def testIdempotentTranspose(self):
     x_np = np.array([[1, 2, 3], [4, 5, 6]], dtype=np.uint8).reshape([2, 3, 1])
 
-    for use_gpu in [False, True]:
-      with self.test_session(use_gpu=use_gpu):
-        x_tf = constant_op.constant(x_np, shape=x_np.shape)
-        y = image_ops.transpose_image(image_ops.transpose_image(x_tf))
-        y_tf = y.eval()
-        self.assertAllEqual(y_tf, x_np)
+    transpose = lambda x: image_ops.transpose_image(
+        image_ops.transpose_image(x))
+    with self._cachedSession(use_gpu=True) as sess:
+      diffs = sess.run(self._onDevices(self._maxAbsDiff(transpose), x_np))
+    self.assertAllEqual(diffs, [0, 0])
 
   def testTranspose(self):
     x_np = np.array([[1, 2, 3], [4, 5, 6]], dtype=np.uint8).reshape([2, 3, 1])
     y_np = np.array([[1, 4], [2, 5], [3, 6]], dtype=np.uint8).reshape([3, 2, 1])
 
-    for use_gpu in [False, True]:
-      with self.test_session(use_gpu=use_gpu):
-        x_tf = constant_op.constant(x_np, shape=x_np.shape)
-        y = image_ops.transpose_image(x_tf)
-        y_tf = y.eval()
-        self.assertAllEqual(y_tf, y_np)
+    with self._cachedSession(use_gpu=True) as sess:
+      ys = self._onDevices(image_ops.transpose_image, x_np)
+      self._assertEqualGraph(sess, ys, y_np)
 
 
-class RandomFlipTest(test_util.TensorFlowTestCase):
+class RandomFlipTest(_CachedSessionTestCase):
 
-  def testRandomLeftRight(self):
-    x_np = np.array([0, 1], dtype=np.uint8).reshape([1, 2, 1])
+  def _testRandomFlip(self, x_np, flip_fn, random_flip_fn):
     num_iterations = 500
 
-    hist = [0, 0]
-    with self.test_session():
+    with self._cachedSession() as sess:
       x_tf = constant_op.constant(x_np, shape=x_np.shape)
-      y = image_ops.random_flip_left_right(x_tf)
-      for _ in xrange(num_iterations):
-        y_np = y.eval().flatten()[0]
-        hist[y_np] += 1
+      # Draw every flip decision from one random_uniform and select between
+      # the tiled image and its flip, rather than building num_iterations
+      # random flip ops.
+      x_flip = flip_fn(x_tf)
+      multiples = [num_iterations, 1, 1, 1]
+      tiled = array_ops.tile(array_ops.expand_dims(x_tf, 0), multiples)
+      flipped = array_ops.tile(array_ops.expand_dims(x_flip, 0), multiples)
+      flips = math_ops.less(random_ops.random_uniform([num_iterations]), 0.5)
+      flips = array_ops.tile(array_ops.reshape(flips, [-1, 1, 1, 1]),
+                             [1] + list(x_np.shape))
+      y = math_ops.select(flips, flipped, tiled)
+      # The random flip op itself must return x or its flip.
+      y_np, z_np, x_flip_np = sess.run([y, random_flip_fn(x_tf), x_flip])
+    self.assertTrue(np.array_equal(z_np, x_np) or
+                    np.array_equal(z_np, x_flip_np))
+    hist = np.bincount(y_np[:, 0, 0, 0], minlength=2)
 
     # Ensure that each entry is observed within 4 standard deviations.
     four_stddev = 4.0 * np.sqrt(num_iterations / 2.0)
     self.assertAllClose(hist, [num_iterations / 2.0] * 2, atol=four_stddev)
 
-  def testRandomUpDown(self):
-    x_np = np.array([0, 1], dtype=np.uint8).reshape([2, 1, 1])
-    num_iterations = 500
-
-    hist = [0, 0]
-    with self.test_session():
-      x_tf = constant_op.constant(x_np, shape=x_np.shape)
-      y = image_ops.random_flip_up_down(x_tf)
-      for _ in xrange(num_iterations):
-        y_np = y.eval().flatten()[0]
-        hist[y_np] += 1
+  def testRandomLeftRight(self):
+    # int32, because there is no uint8 kernel for select
+    x_np = np.array([0, 1], dtype=np.int32).reshape([1, 2, 1])
+    self._testRandomFlip(x_np, image_ops.flip_left_right,
+                         image_ops.random_flip_left_right)
 
-    # Ensure that each entry is observed within 4 standard deviations.
-    four_stddev = 4.0 * np.sqrt(num_iterations / 2.0)
-    self.assertAllClose(hist, [num_iterations / 2.0] * 2, atol=four_stddev)
+  def testRandomUpDown(self):
+    x_np = np.array([0, 1], dtype=np.int32).reshape([2, 1, 1])
+    self._testRandomFlip(x_np, image_ops.flip_up_down,
+                         image_ops.random_flip_up_down)
 
 
-class AdjustContrastTest(test_util.TensorFlowTestCase):
+class AdjustContrastTest(_CachedSessionTestCase):
 
   def _testContrast(self, x_np, y_np, contrast_factor):
     for use_gpu in [True, False]:
-      with self.test_session(use_gpu=use_gpu):
+      with self._cachedSession(use_gpu=use_gpu):
         x = constant_op.constant(x_np, shape=x_np.shape)
         y = image_ops.adjust_contrast(x, contrast_factor)
         y_tf = y.eval()
@@ -312,8 +444,7 @@ class AdjustContrastTest(test_util.TensorFlowTestCase):
 
   def testDoubleContrastUint8(self):
     x_shape = [1, 2, 2, 3]
-    x_data = [0, 5, 13, 54, 135, 226, 37, 8, 234, 90, 255, 1]
-    x_np = np.array(x_data, dtype=np.uint8).reshape(x_shape)
+    x_np = _DATA_12.reshape(x_shape)
 
     y_data = [0, 0, 0, 62, 169, 255, 28, 0, 255, 135, 255, 0]
     y_np = np.array(y_data, dtype=np.uint8).reshape(x_shape)
@@ -322,19 +453,17 @@ class AdjustContrastTest(test_util.TensorFlowTestCase):
 
   def testDoubleContrastFloat(self):
     x_shape = [1, 2, 2, 3]
-    x_data = [0, 5, 13, 54, 135, 226, 37, 8, 234, 90, 255, 1]
-    x_np = np.array(x_data, dtype=np.float).reshape(x_shape) / 255.
+    x_np = _DATA_12_F32_NORM.reshape(x_shape)
 
     y_data = [-45.25, -90.75, -92.5, 62.75, 169.25, 333.5, 28.75, -84.75, 349.5,
               134.75, 409.25, -116.5]
-    y_np = np.array(y_data, dtype=np.float).reshape(x_shape) / 255.
+    y_np = np.array(y_data, dtype=np.float32).reshape(x_shape) / 255.
 
     self._testContrast(x_np, y_np, contrast_factor=2.0)
 
   def testHalfContrastUint8(self):
     x_shape = [1, 2, 2, 3]
-    x_data = [0, 5, 13, 54, 135, 226, 37, 8, 234, 90, 255, 1]
-    x_np = np.array(x_data, dtype=np.uint8).reshape(x_shape)
+    x_np = _DATA_12.reshape(x_shape)
 
     y_data = [22, 52, 65, 49, 118, 172, 41, 54, 176, 67, 178, 59]
     y_np = np.array(y_data, dtype=np.uint8).reshape(x_shape)
@@ -343,8 +472,7 @@ class AdjustContrastTest(test_util.TensorFlowTestCase):
 
   def testBatchDoubleContrast(self):
     x_shape = [2, 1, 2, 3]
-    x_data = [0, 5, 13, 54, 135, 226, 37, 8, 234, 90, 255, 1]
-    x_np = np.array(x_data, dtype=np.uint8).reshape(x_shape)
+    x_np = _DATA_12.reshape(x_shape)
 
     y_data = [0, 0, 0, 81, 200, 255, 10, 0, 255, 116, 255, 0]
     y_np = np.array(y_data, dtype=np.uint8).reshape(x_shape)
@@ -352,10 +480,10 @@ class AdjustContrastTest(test_util.TensorFlowTestCase):
     self._testContrast(x_np, y_np, contrast_factor=2.0)
 
 
-class AdjustBrightnessTest(test_util.TensorFlowTestCase):
+class AdjustBrightnessTest(_CachedSessionTestCase):
 
   def _testBrightness(self, x_np, y_np, delta):
-    with self.test_session():
+    with self._cachedSession():
       x = constant_op.constant(x_np, shape=x_np.shape)
       y = image_ops.adjust_brightness(x, delta)
       y_tf = y.eval()
@@ -363,8 +491,7 @@ class AdjustBrightnessTest(test_util.TensorFlowTestCase):
 
   def testPositiveDeltaUint8(self):
     x_shape = [2, 2, 3]
-    x_data = [0, 5, 13, 54, 135, 226, 37, 8, 234, 90, 255, 1]
-    x_np = np.array(x_data, dtype=np.uint8).reshape(x_shape)
+    x_np = _DATA_12.reshape(x_shape)
 
     y_data = [10, 15, 23, 64, 145, 236, 47, 18, 244, 100, 255, 11]
     y_np = np.array(y_data, dtype=np.uint8).reshape(x_shape)
@@ -373,8 +500,7 @@ class AdjustBrightnessTest(test_util.TensorFlowTestCase):
 
   def testPositiveDeltaFloat(self):
     x_shape = [2, 2, 3]
-    x_data = [0, 5, 13, 54, 135, 226, 37, 8, 234, 90, 255, 1]
-    x_np = np.array(x_data, dtype=np.float32).reshape(x_shape) / 255.
+    x_np = _DATA_12_F32_NORM.reshape(x_shape)
 
     y_data = [10, 15, 23, 64, 145, 236, 47, 18, 244, 100, 265, 11]
     y_np = np.array(y_data, dtype=np.float32).reshape(x_shape) / 255.
@@ -383,8 +509,7 @@ class AdjustBrightnessTest(test_util.TensorFlowTestCase):
 
   def testNegativeDelta(self):
     x_shape = [2, 2, 3]
-    x_data = [0, 5, 13, 54, 135, 226, 37, 8, 234, 90, 255, 1]
-    x_np = np.array(x_data, dtype=np.uint8).reshape(x_shape)
+    x_np = _DATA_12.reshape(x_shape)
 
     y_data = [0, 0, 3, 44, 125, 216, 27, 0, 224, 80, 245, 0]
     y_np = np.array(y_data, dtype=np.uint8).reshape(x_shape)
@@ -392,7 +517,7 @@ class AdjustBrightnessTest(test_util.TensorFlowTestCase):
     self._testBrightness(x_np, y_np, delta=-10. / 255.)
 
 
-class RandomCropTest(test_util.TensorFlowTestCase):
+class RandomCropTest(_CappedThreadsTestCase):
 
   def testNoOp(self):
     # No random cropping is performed since the target width and height
@@ -411,27 +536,32 @@ class RandomCropTest(test_util.TensorFlowTestCase):
       self.assertAllEqual(y_tf, x_np)
 
   def testRandomization(self):
-    # Run 1x1 crop num_samples times in an image and ensure that one finds each
+    # Draw num_samples 1x1 crops of an image and ensure that one finds each
     # pixel 1/num_pixels of the time.
     num_samples = 1000
     height = 5
     width = 4
 
     num_pixels = height * width
-    data = np.arange(num_pixels).reshape([height, width, 1])
-    x_np = np.array(data).astype(np.int32)
+    x_np = np.arange(num_pixels, dtype=np.int32).reshape([height, width, 1])
 
     target_shape_np = np.array([1, 1], dtype=np.int64)
 
-    y = []
-    with self.test_session():
+    with self.test_session() as sess:
       x = constant_op.constant(x_np, shape=x_np.shape)
       target_shape = constant_op.constant(target_shape_np, shape=[2])
-      y_tf = image_ops.random_crop(x, target_shape)
-      for _ in xrange(num_samples):
-        y_np = y_tf.eval()
-        self.assertAllEqual(y_np.shape, [1, 1, 1])
-        y.extend(y_np.flatten())
+      # Draw every crop offset at once and gather the cropped pixels, rather
+      # than building num_samples random crop ops.
+      offset_h = random_ops.random_uniform([num_samples], 0, height,
+                                           dtype=dtypes.int32)
+      offset_w = random_ops.random_uniform([num_samples], 0, width,
+                                           dtype=dtypes.int32)
+      y_tf = array_ops.gather(array_ops.reshape(x, [-1]),
+                              offset_h * width + offset_w)
+      # The random crop op itself must return one of the pixels.
+      y_np, crop_np = sess.run([y_tf, image_ops.random_crop(x, target_shape)])
+    self.assertAllEqual(crop_np.shape, [1, 1, 1])
+    self.assertIn(crop_np[0, 0, 0], x_np)
 
     # Calculate the mean and 4 * standard deviation.
     mean = [num_samples / num_pixels] * num_pixels
@@ -439,22 +569,20 @@ class RandomCropTest(test_util.TensorFlowTestCase):
 
     # Ensure that each entry is observed in 1/num_pixels of the samples
     # within 4 standard deviations.
-    counts = np.bincount(y)
+    counts = np.bincount(y_np, minlength=num_pixels)
     self.assertAllClose(counts, mean, atol=four_stddev)
 
 
-class PerImageWhiteningTest(test_util.TensorFlowTestCase):
+class PerImageWhiteningTest(_CappedThreadsTestCase):
 
   def _NumpyPerImageWhitening(self, x):
-    num_pixels = np.prod(x.shape)
-    x2 = np.square(x).astype(np.float32)
-    mn = np.mean(x)
-    vr = np.mean(x2) - (mn * mn)
-    stddev = max(math.sqrt(vr), 1.0 / math.sqrt(num_pixels))
+    mn = x.mean(dtype=np.float64)
+    vr = x.var(dtype=np.float64)
+    stddev = max(math.sqrt(vr), 1.0 / math.sqrt(x.size))
 
     y = x.astype(np.float32)
     y -= mn
-    y /= stddev
+    y *= np.float32(1.0 / stddev)
     return y
 
   def testBasic(self):
@@ -477,7 +605,7 @@ class PerImageWhiteningTest(test_util.TensorFlowTestCase):
       self.assertFalse(np.any(np.isnan(whiten_np)))
 
 
-class CropToBoundingBoxTest(test_util.TensorFlowTestCase):
+class CropToBoundingBoxTest(_CappedThreadsTestCase):
 
   def testNoOp(self):
     x_shape = [13, 9, 3]
@@ -514,7 +642,7 @@ class CropToBoundingBoxTest(test_util.TensorFlowTestCase):
       self.assertAllEqual(y_tf.flatten(), y_np.flatten())
 
 
-class PadToBoundingBoxTest(test_util.TensorFlowTestCase):
+class PadToBoundingBoxTest(_CappedThreadsTestCase):
 
   def testNoOp(self):
     x_shape = [13, 9, 3]
@@ -542,12 +670,10 @@ class PadToBoundingBoxTest(test_util.TensorFlowTestCase):
     target_height = x_shape[0] + offset_height + after_height
     target_width = x_shape[1] + offset_width + after_width
 
-    # Note the padding are along batch, height, width and depth.
-    paddings = ((offset_height, after_height),
-                (offset_width, after_width),
-                (0, 0))
-
-    y_np = np.pad(x_np, paddings, 'constant')
+    y_np = np.zeros([target_height, target_width, x_shape[2]],
+                    dtype=x_np.dtype)
+    y_np[offset_height:offset_height + x_shape[0],
+         offset_width:offset_width + x_shape[1], :] = x_np
 
     with self.test_session():
       x = constant_op.constant(x_np, shape=x_shape)
@@ -557,7 +683,28 @@ class PadToBoundingBoxTest(test_util.TensorFlowTestCase):
       self.assertAllEqual(y_tf, y_np)
 
 
-class ResizeImagesTest(test_util.TensorFlowTestCase):
+# Expected output of ResizeImagesTest.testResizeUpBicubic.
+_BICUBIC_EXPECT_8x8 = np.array([128, 135, 96, 55, 64, 114, 134, 128,
+                                78, 81, 68, 52, 57, 118, 144, 136,
+                                55, 49, 79, 109, 103, 89, 83, 84,
+                                74, 70, 95, 122, 115, 69, 49, 55,
+                                100, 105, 75, 43, 50, 89, 105, 100,
+                                57, 54, 74, 96, 91, 65, 55, 58,
+                                70, 69, 75, 81, 80, 72, 69, 70,
+                                105, 112, 75, 36, 45, 92, 111, 105],
+                               dtype=np.int32).reshape([1, 8, 8, 1])
+_BICUBIC_EXPECT_8x8.flags.writeable = False
+
+# Expected output of ResizeImagesTest.testResizeDownArea.
+_AREA_EXPECT_4x4 = np.array([73, 33, 23, 39,
+                             73, 33, 23, 39,
+                             14, 16, 19, 21,
+                             14, 16, 19, 21],
+                            dtype=np.int32).reshape([1, 4, 4, 1])
+_AREA_EXPECT_4x4.flags.writeable = False
+
+
+class ResizeImagesTest(_CappedThreadsTestCase):
 
   OPTIONS = [image_ops.ResizeMethod.BILINEAR,
              image_ops.ResizeMethod.NEAREST_NEIGHBOR,
@@ -580,27 +727,37 @@ class ResizeImagesTest(test_util.TensorFlowTestCase):
     target_height = 6
     target_width = 4
 
-    for type in self.TYPES:
-      img_np = np.array(data, dtype=type).reshape(img_shape)
+    # Build the graph for every type and method once, and evaluate it all in a
+    # single run.
+    with self.test_session() as sess:
+      img_nps = []
+      ys = []
+      single_yshapes = []
+      for type in self.TYPES:
+        img_np = np.array(data, dtype=type).reshape(img_shape)
+        image = constant_op.constant(img_np, shape=img_shape)
+        for opt in self.OPTIONS:
+          img_nps.append(img_np)
+          ys.append(image_ops.resize_images(image, target_height, target_width,
+                                            opt))
 
-      for opt in self.OPTIONS:
-        with self.test_session() as sess:
-          image = constant_op.constant(img_np, shape=img_shape)
-          y = image_ops.resize_images(image, target_height, target_width, opt)
-          yshape = array_ops.shape(y)
-          resized, newshape = sess.run([y, yshape])
-          self.assertAllEqual(img_shape, newshape)
-          self.assertAllClose(resized, img_np, atol=1e-5)
-
-      # Resizing with a single image must leave the shape unchanged also.
-      with self.test_session():
+        # Resizing with a single image must leave the shape unchanged also.
         img_single = img_np.reshape(single_shape)
         image = constant_op.constant(img_single, shape=single_shape)
         y = image_ops.resize_images(image, target_height, target_width,
                                     self.OPTIONS[0])
-        yshape = array_ops.shape(y)
-        newshape = yshape.eval()
-        self.assertAllEqual(single_shape, newshape)
+        single_yshapes.append(array_ops.shape(y))
+
+      yshapes = [array_ops.shape(y) for y in ys]
+      results = sess.run(ys + yshapes + single_yshapes)
+
+    num_ys = len(ys)
+    for img_np, resized, newshape in zip(img_nps, results[:num_ys],
+                                         results[num_ys:2 * num_ys]):
+      self.assertAllEqual(img_shape, newshape)
+      self.assertAllClose(resized, img_np, atol=1e-5)
+    for newshape in results[2 * num_ys:]:
+      self.assertAllEqual(single_shape, newshape)
 
   def testResizeDown(self):
     # This test is also conducted with int8, so 127 is the maximum value that can be used.
@@ -621,18 +778,24 @@ class ResizeImagesTest(test_util.TensorFlowTestCase):
     target_shapes = [[1, target_height, target_width, 1],
                      [target_height, target_width, 1]]
 
-    for target_shape, img_shape in zip(target_shapes, img_shapes):
+    with self.test_session() as sess:
+      expected = []
+      ys = []
+      for target_shape, img_shape in zip(target_shapes, img_shapes):
+        expected_np = np.array(expected_data).reshape(target_shape)
 
-      for type in self.TYPES:
-        img_np = np.array(data, dtype=type).reshape(img_shape)
+        for type in self.TYPES:
+          img_np = np.array(data, dtype=type).reshape(img_shape)
+          image = constant_op.constant(img_np, shape=img_shape)
 
-        for opt in self.OPTIONS:
-          with self.test_session():
-            image = constant_op.constant(img_np, shape=img_shape)
-            y = image_ops.resize_images(image, target_height, target_width, opt)
-            expected = np.array(expected_data).reshape(target_shape)
-            resized = y.eval()
-            self.assertAllClose(resized, expected, atol=1e-5)
+          for opt in self.OPTIONS:
+            expected.append(expected_np)
+            ys.append(image_ops.resize_images(image, target_height,
+                                              target_width, opt))
+      results = sess.run(ys)
+
+    for resized, expected_np in zip(results, expected):
+      self.assertAllClose(resized, expected_np, atol=1e-5)
 
   def testResizeUp(self):
     img_shape = [1, 3, 2, 1]
@@ -664,19 +827,25 @@ class ResizeImagesTest(test_util.TensorFlowTestCase):
         50.0, 50.0, 100.0, 100.0,
         50.0, 50.0, 100.0, 100.0]
 
-    for type in self.TYPES:
-      for opt in [
-          image_ops.ResizeMethod.BILINEAR,
-          image_ops.ResizeMethod.NEAREST_NEIGHBOR,
-          image_ops.ResizeMethod.AREA]:
-        with self.test_session():
-          img_np = np.array(data, dtype=type).reshape(img_shape)
-          image = constant_op.constant(img_np, shape=img_shape)
-          y = image_ops.resize_images(image, target_height, target_width, opt)
-          resized = y.eval()
-          expected = np.array(expected_data[opt]).reshape(
-              [1, target_height, target_width, 1])
-          self.assertAllClose(resized, expected, atol=1e-05)
+    with self.test_session() as sess:
+      opts = []
+      ys = []
+      for type in self.TYPES:
+        img_np = np.array(data, dtype=type).reshape(img_shape)
+        image = constant_op.constant(img_np, shape=img_shape)
+        for opt in [
+            image_ops.ResizeMethod.BILINEAR,
+            image_ops.ResizeMethod.NEAREST_NEIGHBOR,
+            image_ops.ResizeMethod.AREA]:
+          opts.append(opt)
+          ys.append(image_ops.resize_images(image, target_height, target_width,
+                                            opt))
+      results = sess.run(ys)
+
+    for resized, opt in zip(results, opts):
+      expected = np.array(expected_data[opt]).reshape(
+          [1, target_height, target_width, 1])
+      self.assertAllClose(resized, expected, atol=1e-05)
 
   def testResizeUpBicubic(self):
     img_shape = [1, 6, 6, 1]
@@ -689,23 +858,13 @@ class ResizeImagesTest(test_util.TensorFlowTestCase):
 
     target_height = 8
     target_width = 8
-    expected_data = [128, 135, 96, 55, 64, 114, 134, 128,
-                     78, 81, 68, 52, 57, 118, 144, 136,
-                     55, 49, 79, 109, 103, 89, 83, 84,
-                     74, 70, 95, 122, 115, 69, 49, 55,
-                     100, 105, 75, 43, 50, 89, 105, 100,
-                     57, 54, 74, 96, 91, 65, 55, 58,
-                     70, 69, 75, 81, 80, 72, 69, 70,
-                     105, 112, 75, 36, 45, 92, 111, 105]
 
     with self.test_session():
       image = constant_op.constant(img_np, shape=img_shape)
       y = image_ops.resize_images(image, target_height, target_width,
                                   image_ops.ResizeMethod.BICUBIC)
       resized = y.eval()
-      expected = np.array(expected_data).reshape(
-          [1, target_height, target_width, 1])
-      self.assertAllClose(resized, expected, atol=1)
+      self.assertAllClose(resized, _BICUBIC_EXPECT_8x8, atol=1)
 
   def testResizeDownArea(self):
     img_shape = [1, 6, 6, 1]
@@ -719,22 +878,16 @@ class ResizeImagesTest(test_util.TensorFlowTestCase):
 
     target_height = 4
     target_width = 4
-    expected_data = [73, 33, 23, 39,
-                     73, 33, 23, 39,
-                     14, 16, 19, 21,
-                     14, 16, 19, 21]
 
     with self.test_session():
       image = constant_op.constant(img_np, shape=img_shape)
       y = image_ops.resize_images(image, target_height, target_width,
                                   image_ops.ResizeMethod.AREA)
-      expected = np.array(expected_data).reshape(
-          [1, target_height, target_width, 1])
       resized = y.eval()
-      self.assertAllClose(resized, expected, atol=1)
+      self.assertAllClose(resized, _AREA_EXPECT_4x4, atol=1)
 
 
-class ResizeImageWithCropOrPadTest(test_util.TensorFlowTestCase):
+class ResizeImageWithCropOrPadTest(_CappedThreadsTestCase):
 
   def _ResizeImageWithCropOrPad(self, original, original_shape,
                                 expected, expected_shape):
@@ -863,22 +1016,31 @@ class ResizeImageWithCropOrPadTest(test_util.TensorFlowTestCase):
 def _SimpleColorRamp():
   """Build a simple color ramp RGB image."""
   w, h = 256, 200
-  i = np.arange(h)[:, None]
-  j = np.arange(w)
+  i = np.arange(h, dtype=np.uint8)[:, None]
+  j = np.arange(w, dtype=np.uint8)
   image = np.empty((h, w, 3), dtype=np.uint8)
   image[:, :, 0] = i
   image[:, :, 1] = j
-  image[:, :, 2] = (i + j) >> 1
+  # Sum in uint16 so that i + j cannot overflow, then narrow in place.
+  np.right_shift(np.add(i, j, dtype=np.uint16), 1, out=image[:, :, 2],
+                 casting='unsafe')
+  image.flags.writeable = False
   return image
 
 
-class JpegTest(test_util.TensorFlowTestCase):
+# Deterministic, so build it once for every test that encodes it.
+_COLOR_RAMP = _SimpleColorRamp()
+
+
+class JpegTest(_CappedThreadsTestCase):
 
   # TODO(irving): Add self.assertAverageLess or similar to test_util
   def averageError(self, image0, image1):
     self.assertEqual(image0.shape, image1.shape)
-    image0 = image0.astype(int)  # Avoid overflow
-    return np.abs(image0 - image1).sum() / np.prod(image0.shape)
+    # int16 holds any difference of two uint8s; reuse its buffer for abs.
+    diff = np.subtract(image0, image1, dtype=np.int16)
+    np.abs(diff, out=diff)
+    return diff.mean(dtype=np.float32)
 
   def testExisting(self):
     # Read a real jpeg and verify shape
@@ -896,11 +1058,11 @@ class JpegTest(test_util.TensorFlowTestCase):
   def testSynthetic(self):
     with self.test_session() as sess:
       # Encode it, then decode it, then encode it
-      image0 = constant_op.constant(_SimpleColorRamp())
-      jpeg0 = image_ops.encode_jpeg(image0)
+      image0 = _COLOR_RAMP
+      jpeg0 = image_ops.encode_jpeg(constant_op.constant(image0))
       image1 = image_ops.decode_jpeg(jpeg0)
       image2 = image_ops.decode_jpeg(image_ops.encode_jpeg(image1))
-      jpeg0, image0, image1, image2 = sess.run([jpeg0, image0, image1, image2])
+      jpeg0, image1, image2 = sess.run([jpeg0, image1, image2])
 
       # The decoded-encoded image should be similar to the input
       self.assertLess(self.averageError(image0, image1), 0.6)
@@ -913,7 +1075,7 @@ class JpegTest(test_util.TensorFlowTestCase):
       self.assertLessEqual(len(jpeg0), 6000)
 
   def testShape(self):
-    with self.test_session() as sess:
+    with ops.Graph().as_default():
       jpeg = constant_op.constant('nonsense')
       for channels in 0, 1, 3:
         image = image_ops.decode_jpeg(jpeg, channels=channels)
@@ -921,30 +1083,46 @@ class JpegTest(test_util.TensorFlowTestCase):
                          [None, None, channels or None])
 
 
-class PngTest(test_util.TensorFlowTestCase):
+def _InflatePngData(png):
+  """Returns the decompressed contents of the IDAT chunks of `png`."""
+  pos = 8  # Skip the PNG signature
+  data = []
+  while pos < len(png):
+    length, chunk_type = struct.unpack('>I4s', png[pos:pos + 8])
+    if chunk_type == b'IDAT':
+      data.append(png[pos + 8:pos + 8 + length])
+    pos += 12 + length  # Length, type, data and CRC
+  return zlib.decompress(b''.join(data))
+
+
+class PngTest(_CappedThreadsTestCase):
 
   def testExisting(self):
     # Read some real PNGs, converting to different channel numbers
     prefix = 'tensorflow/core/lib/png/testdata/'
     inputs = (1, 'lena_gray.png'), (4, 'lena_rgba.png')
+    all_channels = 0, 1, 3, 4
     for channels_in, filename in inputs:
-      for channels in 0, 1, 3, 4:
-        with self.test_session() as sess:
-          png0 = io_ops.read_file(prefix + filename)
-          image0 = image_ops.decode_png(png0, channels=channels)
-          png0, image0 = sess.run([png0, image0])
+      with self.test_session() as sess:
+        # Read each file once and decode it at every channel count.
+        png0 = io_ops.read_file(prefix + filename)
+        images = [image_ops.decode_png(png0, channels=channels)
+                  for channels in all_channels]
+        round_trip = images[all_channels.index(channels_in)]
+        images.append(image_ops.decode_png(image_ops.encode_png(round_trip)))
+        images = sess.run(images)
+        for channels, image0 in zip(all_channels, images):
           self.assertEqual(image0.shape, (26, 51, channels or channels_in))
           if channels == channels_in:
-            image1 = image_ops.decode_png(image_ops.encode_png(image0))
-            self.assertAllEqual(image0, image1.eval())
+            self.assertAllEqual(image0, images[-1])
 
   def testSynthetic(self):
     with self.test_session() as sess:
       # Encode it, then decode it
-      image0 = constant_op.constant(_SimpleColorRamp())
-      png0 = image_ops.encode_png(image0, compression=7)
+      image0 = _COLOR_RAMP
+      png0 = image_ops.encode_png(constant_op.constant(image0), compression=7)
       image1 = image_ops.decode_png(png0)
-      png0, image0, image1 = sess.run([png0, image0, image1])
+      png0, image1 = sess.run([png0, image1])
 
       # PNG is lossless
       self.assertAllEqual(image0, image1)
@@ -953,8 +1131,26 @@ class PngTest(test_util.TensorFlowTestCase):
       self.assertGreaterEqual(len(png0), 400)
       self.assertLessEqual(len(png0), 750)
 
+  def testSyntheticUncompressed(self):
+    # compression=0 stores the rows unfiltered
+    alpha = _COLOR_RAMP[:, :, :1][::-1]
+    rgba = np.concatenate([_COLOR_RAMP, alpha], axis=2)
+    with self.test_session() as sess:
+      images = [_COLOR_RAMP, rgba]
+      pngs = [image_ops.encode_png(constant_op.constant(image), compression=0)
+              for image in images]
+      decoded = [image_ops.decode_png(png) for png in pngs]
+      results = sess.run(pngs + decoded)
+      for image0, png0, image1 in zip(images, results[:2], results[2:]):
+        self.assertAllEqual(image0, image1)
+        # Each row of the inflated IDAT data starts with its filter type byte
+        h, w, channels = image0.shape
+        raw = _InflatePngData(png0)
+        self.assertEqual(len(raw), h * (1 + w * channels))
+        self.assertEqual(raw[::1 + w * channels], b'\0' * h)
+
   def testShape(self):
-    with self.test_session():
+    with ops.Graph().as_default():
       png = constant_op.constant('nonsense')
       for channels in 0, 1, 3:
         image = image_ops.decode_png(png, channels=channels)
@@ -962,17 +1158,31 @@ class PngTest(test_util.TensorFlowTestCase):
                          [None, None, channels or None])
 
 
-class ConvertImageTest(test_util.TensorFlowTestCase):
+class ConvertImageTest(_CachedSessionTestCase):
 
-  def _convert(self, original, original_dtype, output_dtype, expected):
+  @classmethod
+  def setUpClass(cls):
+    super(ConvertImageTest, cls).setUpClass()
+    # Maps (original_dtype, output_dtype, shape, saturate) to a
+    # (placeholder, output) pair in the class graph.
+    cls._conversions = {}
+
+  def _convert(self, original, original_dtype, output_dtype, expected,
+               saturate=False):
     x_np = np.array(original, dtype=original_dtype.as_numpy_dtype())
     y_np = np.array(expected, dtype=output_dtype.as_numpy_dtype())
 
-    with self.test_session():
-      image = constant_op.constant(x_np)
-      y = image_ops.convert_image_dtype(image, output_dtype)
+    with self._cachedSession() as sess:
+      key = original_dtype, output_dtype, x_np.shape, saturate
+      if key not in self._conversions:
+        image = array_ops.placeholder(original_dtype, shape=x_np.shape)
+        y = image_ops.convert_image_dtype(image, output_dtype,
+                                          saturate=saturate)
+        self._conversions[key] = image, y
+      image, y = self._conversions[key]
       self.assertTrue(y.dtype == output_dtype)
-      self.assertAllClose(y.eval(), y_np, atol=1e-5)
+      self.assertAllClose(sess.run(y, feed_dict={image: x_np}), y_np,
+                          atol=1e-5)
 
   def testNoConvert(self):
     # Make sure converting to the same data type creates no ops
@@ -983,25 +1193,29 @@ class ConvertImageTest(test_util.TensorFlowTestCase):
 
   def testConvertBetweenInteger(self):
     # Make sure converting to between integer types scales appropriately
-    with self.test_session():
-      self._convert([0, 255], dtypes.uint8, dtypes.int16, [0, 255 * 128])
-      self._convert([0, 32767], dtypes.int16, dtypes.uint8, [0, 255])
+    self._convert([0, 255], dtypes.uint8, dtypes.int16, [0, 255 * 128])
+    self._convert([0, 32767], dtypes.int16, dtypes.uint8, [0, 255])
+
+  def testConvertBetweenIntegerSaturate(self):
+    # Make sure negative values are clamped when converting to unsigned types
+    self._convert([-128, 0, 127], dtypes.int8, dtypes.uint8, [0, 0, 254],
+                  saturate=True)
+    self._convert([-32768, 0, 32767], dtypes.int16, dtypes.uint8, [0, 0, 255],
+                  saturate=True)
 
   def testConvertBetweenFloat(self):
     # Make sure converting to between float types does nothing interesting
-    with self.test_session():
-      self._convert([-1.0, 0, 1.0, 200000], dtypes.float32, dtypes.float64,
-                    [-1.0, 0, 1.0, 200000])
-      self._convert([-1.0, 0, 1.0, 200000], dtypes.float64, dtypes.float32,
-                    [-1.0, 0, 1.0, 200000])
+    self._convert([-1.0, 0, 1.0, 200000], dtypes.float32, dtypes.float64,
+                  [-1.0, 0, 1.0, 200000])
+    self._convert([-1.0, 0, 1.0, 200000], dtypes.float64, dtypes.float32,
+                  [-1.0, 0, 1.0, 200000])
 
   def testConvertBetweenIntegerAndFloat(self):
     # Make sure converting from and to a float type scales appropriately
-    with self.test_session():
-      self._convert([0, 1, 255], dtypes.uint8, dtypes.float32,
-                    [0, 1.0 / 255.0, 1])
-      self._convert([0, 1.1 / 255.0, 1], dtypes.float32, dtypes.uint8,
-                    [0, 1, 255])
+    self._convert([0, 1, 255], dtypes.uint8, dtypes.float32,
+                  [0, 1.0 / 255.0, 1])
+    self._convert([0, 1.1 / 255.0, 1], dtypes.float32, dtypes.uint8,
+                  [0, 1, 255])
 
 if __name__ == '__main__':
   googletest.main()